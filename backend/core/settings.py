@@ -129,6 +129,40 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# LocMemCache is per process: invalidation on upload/delete only reaches the
+# worker that handled it, so other workers may serve dashboard data up to
+# DASHBOARD_CACHE_TIMEOUT old. Use a shared backend (e.g. Redis) with several workers.
+CACHES = {
+  "default": {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+  }
+}
+
+# How long (in seconds) dashboard statistics are cached between uploads
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 30))
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+  "version": 1,
+  "disable_existing_loggers": False,
+  "handlers": {
+    "console": {
+      "class": "logging.StreamHandler",
+    },
+  },
+  "loggers": {
+    "files": {
+      "handlers": ["console"],
+      "level": os.environ.get('FILES_LOG_LEVEL', 'INFO'),
+    },
+  },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -150,6 +184,12 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = True  # Configure appropriately in production
 CORS_ALLOW_CREDENTIALS = True
 
+# Hash uploads while they are received instead of re-reading them in the view
+FILE_UPLOAD_HANDLERS = [
+    'files.upload_handlers.HashingMemoryFileUploadHandler',
+    'files.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
 # Increase max upload size to 2GB (in bytes)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024 * 1024
\ No newline at end of file
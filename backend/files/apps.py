@@ -1,6 +1,36 @@
+import logging
+import ssl
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
+
+def cpu_has_sha_ni():
+  """Check whether the CPU advertises the SHA extensions (None if unknown)"""
+  try:
+    with open('/proc/cpuinfo') as cpuinfo:
+      for line in cpuinfo:
+        if line.startswith(('flags', 'Features')):
+          flags = line.split(':', 1)[1].split()
+          # x86 reports sha_ni, ARMv8 reports sha2
+          return 'sha_ni' in flags or 'sha2' in flags
+  except OSError:
+    pass
+  return None
+
 
 class FilesConfig(AppConfig):
   default_auto_field = "django.db.models.BigAutoField"
   name = "files"
+
+  def ready(self):
+    from . import signals  # noqa: F401 - registers the cache invalidation receivers
+
+    # hashlib uses OpenSSL's SHA-256, which picks the SHA-NI code path on its
+    # own when the CPU supports it - log what we are running on
+    sha_ni = cpu_has_sha_ni()
+    logger.info("Hashing with %s (SHA CPU extensions: %s)", ssl.OPENSSL_VERSION,
+                'unknown' if sha_ni is None else 'yes' if sha_ni else 'no')
+    if sha_ni is False:
+      logger.warning("CPU does not support SHA extensions, upload hashing will use the software SHA-256")
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-14 14:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_originals(apps, schema_editor):
+    """Keep the oldest original per hash and turn racing copies into its duplicates"""
+    File = apps.get_model('files', 'File')
+    hashes = (
+        File.objects.filter(is_duplicate=False).exclude(file_hash=None)
+        .values('file_hash')
+        .annotate(originals=Count('id'))
+        .filter(originals__gt=1)
+        .values_list('file_hash', flat=True)
+    )
+    for file_hash in hashes:
+        originals = File.objects.filter(file_hash=file_hash, is_duplicate=False).order_by('uploaded_at', 'id')
+        keep = originals.first()
+        extra = list(originals.exclude(pk=keep.pk).values_list('pk', flat=True))
+        # Duplicates of the extra copies now point at the kept original
+        File.objects.filter(reference_file__in=extra).update(reference_file=keep, file=keep.file.name)
+        File.objects.filter(pk__in=extra).update(is_duplicate=True, reference_file=keep, file=keep.file.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_alter_file_file_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_originals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='file',
+            name='file_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['file_hash', 'is_duplicate'], name='files_file_file_ha_bd8e27_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_duplicate', False)), fields=('file_hash',), name='uniq_original_hash'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-14 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_file_hash_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['-uploaded_at', 'id'], name='files_upload_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['size'], name='files_file_size_6009e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['original_filename'], name='files_file_origina_63129f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['file_type'], name='files_file_file_ty_2d7e73_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-14 14:50
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_same_day_savings(apps, schema_editor):
+    """Fold rows left behind by racing get_or_create calls into one per date"""
+    StorageSaving = apps.get_model('files', 'StorageSaving')
+    dates = (
+        StorageSaving.objects.values('date')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .values_list('date', flat=True)
+    )
+    for date in dates:
+        rows = StorageSaving.objects.filter(date=date).order_by('id')
+        totals = rows.aggregate(bytes_saved=Sum('bytes_saved'), duplicate_count=Sum('duplicate_count'))
+        keep = rows.first()
+        rows.exclude(pk=keep.pk).delete()
+        StorageSaving.objects.filter(pk=keep.pk).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_search_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_same_day_savings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='storagesaving',
+            name='date',
+            field=models.DateField(auto_now_add=True, unique=True),
+        ),
+    ]
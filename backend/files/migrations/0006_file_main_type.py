@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-14 14:55
+
+from django.db import migrations, models
+from django.db.models import Case, When, F, Value
+from django.db.models.functions import Substr, StrIndex
+
+
+def backfill_main_type(apps, schema_editor):
+    """Populate main_type for existing rows in a single UPDATE"""
+    File = apps.get_model('files', 'File')
+    File.objects.update(main_type=Case(
+        When(file_type__contains='/', then=Substr('file_type', 1, StrIndex('file_type', Value('/')) - 1)),
+        default=F('file_type'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_storagesaving_unique_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='main_type',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_main_type, migrations.RunPython.noop),
+    ]
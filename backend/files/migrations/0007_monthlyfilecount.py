@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-14 14:56
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def backfill_monthly_counts(apps, schema_editor):
+    """Seed the per-month counts from the files already uploaded"""
+    File = apps.get_model('files', 'File')
+    MonthlyFileCount = apps.get_model('files', 'MonthlyFileCount')
+    entries = (
+        File.objects
+        .annotate(month=TruncMonth('uploaded_at'))
+        .values('month')
+        .annotate(count=Count('id'))
+        .order_by('month')
+    )
+    MonthlyFileCount.objects.bulk_create([
+        MonthlyFileCount(month=entry['month'].date(), count=entry['count'])
+        for entry in entries
+        if entry['month']
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_file_main_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyFileCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_monthly_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-14 15:05
+
+from django.db import migrations, models
+
+
+def hex_to_binary(apps, schema_editor):
+    """Convert the stored hex digests to raw 32-byte digests"""
+    File = apps.get_model('files', 'File')
+    batch = []
+    for file in File.objects.exclude(file_hash=None).only('id', 'file_hash').iterator(chunk_size=2000):
+        file.file_hash_bin = bytes.fromhex(file.file_hash)
+        batch.append(file)
+        if len(batch) >= 2000:
+            File.objects.bulk_update(batch, ['file_hash_bin'])
+            batch = []
+    File.objects.bulk_update(batch, ['file_hash_bin'])
+
+
+def binary_to_hex(apps, schema_editor):
+    """Convert raw digests back to hex strings"""
+    File = apps.get_model('files', 'File')
+    batch = []
+    for file in File.objects.exclude(file_hash_bin=None).only('id', 'file_hash_bin').iterator(chunk_size=2000):
+        file.file_hash = bytes(file.file_hash_bin).hex()
+        batch.append(file)
+        if len(batch) >= 2000:
+            File.objects.bulk_update(batch, ['file_hash'])
+            batch = []
+    File.objects.bulk_update(batch, ['file_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_monthlyfilecount'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='file',
+            name='uniq_original_hash',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_file_ha_bd8e27_idx',
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='file_hash_bin',
+            field=models.BinaryField(max_length=32, null=True),
+        ),
+        migrations.RunPython(hex_to_binary, binary_to_hex),
+        migrations.RemoveField(
+            model_name='file',
+            name='file_hash',
+        ),
+        migrations.RenameField(
+            model_name='file',
+            old_name='file_hash_bin',
+            new_name='file_hash',
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['file_hash', 'is_duplicate'], name='files_file_file_ha_bd8e27_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_duplicate', False)), fields=('file_hash',), name='uniq_original_hash'),
+        ),
+    ]
@@ -2,67 +2,142 @@
 from django.db import models
 import uuid
 import os
+import sys
 import hashlib
 
-def calculate_file_hash(file_content):
-    """Calculate SHA-256 hash of file content"""
-    return hashlib.sha256(file_content).hexdigest()
+# Read uploads in 1 MiB blocks when hashing so memory stays bounded
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def calculate_file_hash(file_obj):
+    """Calculate the raw SHA-256 digest of a file-like object without reading it all into memory
+
+    Accepts Django uploaded files as well as plain binary file objects.
+    """
+    # Uploaded files wrap the real file object; plain files are used as-is
+    raw_file = getattr(file_obj, 'file', file_obj)
+    raw_file.seek(0)
+    if sys.version_info >= (3, 11):
+        # file_digest reads with readinto in a C loop
+        digest = hashlib.file_digest(raw_file, 'sha256')
+    else:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: raw_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    raw_file.seek(0)  # Reset file pointer
+    return digest.digest()
+
+def get_main_type(file_type):
+    """Main file type category of a MIME type (e.g., image/png -> image)"""
+    return file_type.split('/')[0] if '/' in file_type else file_type
 
 def file_upload_path(instance, filename):
     """Generate file path for new file upload with hash-based naming"""
     ext = filename.split('.')[-1]
-    filename = f"{instance.file_hash}.{ext}"
-    return os.path.join('uploads', filename)
+    prefix = os.path.join('uploads', f"{bytes(instance.file_hash).hex()}.")
+    # The key must keep the whole hash, so trim overlong extensions to fit the field
+    max_ext_length = instance._meta.get_field('file').max_length - len(prefix)
+    return prefix + ext[:max_ext_length]
 
 class File(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to=file_upload_path)
     original_filename = models.CharField(max_length=255)
     file_type = models.CharField(max_length=100)
+    main_type = models.CharField(max_length=100, db_index=True, editable=False)  # Derived from file_type in save()
     size = models.BigIntegerField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     # Fields for deduplication
-    file_hash = models.CharField(max_length=64, db_index=True, null=True)  # Added null=True
+    file_hash = models.BinaryField(max_length=32, null=True)  # Raw SHA-256 digest, indexed with is_duplicate below
     is_duplicate = models.BooleanField(default=False)
     reference_file = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['file_hash', 'is_duplicate']),
+            # Indexes backing the sortable search columns
+            models.Index(fields=['-uploaded_at', 'id'], name='files_upload_desc_idx'),
+            models.Index(fields=['size']),
+            models.Index(fields=['original_filename']),
+            models.Index(fields=['file_type']),
+        ]
+        constraints = [
+            # Only one original file may exist per hash
+            models.UniqueConstraint(fields=['file_hash'], condition=models.Q(is_duplicate=False), name='uniq_original_hash'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.main_type = get_main_type(self.file_type)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.original_filename
 
 class StorageSaving(models.Model):
     """Model to track storage savings from deduplication"""
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(auto_now_add=True, unique=True)
     bytes_saved = models.BigIntegerField(default=0)
     duplicate_count = models.IntegerField(default=0)
     
     @classmethod
-    def add_saving(cls, file_size):
-        """Add a new storage saving record"""
-        # Get or create today's record
+    def add_saving(cls, bytes_saved, duplicate_count=1):
+        """Add duplicates' total size to today's storage saving record"""
+        from django.db import IntegrityError, transaction
+        from django.db.models import F
         from django.utils import timezone
-        today = timezone.now().date()
-        saving, created = cls.objects.get_or_create(date=today)
-        
-        # Update savings
-        saving.bytes_saved += file_size
-        saving.duplicate_count += 1
-        saving.save()
+        # auto_now_add fills date with the local (TIME_ZONE) date, so match on that
+        today = timezone.localdate()
         
-        return saving
+        # Increment in a single UPDATE so concurrent uploads can't lose counts
+        increment = {
+            'bytes_saved': F('bytes_saved') + bytes_saved,
+            'duplicate_count': F('duplicate_count') + duplicate_count,
+        }
+        if not cls.objects.filter(date=today).update(**increment):
+            # First duplicate of the day - create today's record
+            try:
+                with transaction.atomic():
+                    cls.objects.create(bytes_saved=bytes_saved, duplicate_count=duplicate_count)
+            except IntegrityError:
+                # Another upload created it first
+                cls.objects.filter(date=today).update(**increment)
     
     @classmethod
     def get_total_savings(cls):
         """Get total storage savings"""
-        # Sum all savings
+        # Sum all savings in a single query
         from django.db.models import Sum
-        total_bytes = cls.objects.aggregate(total=Sum('bytes_saved'))['total'] or 0
-        total_count = cls.objects.aggregate(total=Sum('duplicate_count'))['total'] or 0
+        from django.db.models.functions import Coalesce
+        totals = cls.objects.aggregate(
+            total_bytes=Coalesce(Sum('bytes_saved'), 0),
+            total_count=Coalesce(Sum('duplicate_count'), 0),
+        )
         
         return {
-            'total_bytes_saved': total_bytes,
-            'total_duplicate_count': total_count
-        }
\ No newline at end of file
+            'total_bytes_saved': totals['total_bytes'],
+            'total_duplicate_count': totals['total_count']
+        }
+
+class MonthlyFileCount(models.Model):
+    """Number of files uploaded per month, kept in step with File inserts and deletes"""
+    month = models.DateField(unique=True)  # First day of the month
+    count = models.IntegerField(default=0)
+    
+    @classmethod
+    def add_files(cls, uploaded_at, delta=1):
+        """Adjust the count for the month a file was uploaded in"""
+        from django.db import IntegrityError, transaction
+        from django.db.models import F
+        from django.utils import timezone
+        month = timezone.localtime(uploaded_at).date().replace(day=1)
+        
+        # Single UPDATE so concurrent uploads can't lose counts
+        if not cls.objects.filter(month=month).update(count=F('count') + delta) and delta > 0:
+            # First file of the month - create the month's record
+            try:
+                with transaction.atomic():
+                    cls.objects.create(month=month, count=delta)
+            except IntegrityError:
+                # Another upload created it first
+                cls.objects.filter(month=month).update(count=F('count') + delta)
@@ -1,10 +1,13 @@
 from rest_framework import serializers
 from .models import File, StorageSaving
 
+# Units for human-readable sizes, largest first
+BYTE_UNITS = [(1 << 50, 'PB'), (1 << 40, 'TB'), (1 << 30, 'GB'), (1 << 20, 'MB'), (1 << 10, 'KB'), (1, 'B')]
+
 class FileSerializer(serializers.ModelSerializer):
     is_duplicate = serializers.BooleanField(read_only=True)
-    file_hash = serializers.CharField(read_only=True)
-    reference_file_id = serializers.UUIDField(source='reference_file.id', read_only=True, allow_null=True)
+    file_hash = serializers.SerializerMethodField()
+    reference_file_id = serializers.UUIDField(read_only=True, allow_null=True)  # Raw FK column, no join needed
     
     class Meta:
         model = File
@@ -13,6 +16,20 @@ class FileSerializer(serializers.ModelSerializer):
             'uploaded_at', 'is_duplicate', 'file_hash', 'reference_file_id'
         ]
         read_only_fields = ['id', 'uploaded_at', 'is_duplicate', 'file_hash', 'reference_file_id']
+    
+    def get_file_hash(self, obj):
+        """Hash is stored as raw bytes, expose it as hex"""
+        return bytes(obj.file_hash).hex() if obj.file_hash is not None else None
+
+class FileFromHashSerializer(serializers.Serializer):
+    """Body of a POST /files/ that registers stored content by its SHA-256"""
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    original_filename = serializers.CharField(max_length=255)
+    file_type = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
+    def validate_sha256(self, value):
+        """Hashes are stored as raw bytes"""
+        return bytes.fromhex(value)
 
 class StorageSavingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,8 +48,7 @@ class StorageSavingSummarySerializer(serializers.Serializer):
     def get_formatted_bytes_saved(self, obj):
         """Convert bytes to human-readable format"""
         bytes_saved = obj['total_bytes_saved']
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes_saved < 1024.0:
-                return f"{bytes_saved:.2f} {unit}"
-            bytes_saved /= 1024.0
-        return f"{bytes_saved:.2f} PB"
\ No newline at end of file
+        for unit_size, unit in BYTE_UNITS:
+            if bytes_saved >= unit_size:
+                return f"{bytes_saved / unit_size:.2f} {unit}"
+        return f"{bytes_saved:.2f} B"
\ No newline at end of file
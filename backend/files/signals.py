@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import File, StorageSaving, MonthlyFileCount
+
+# Cache keys for the dashboard endpoints (bump the version when the payload changes)
+STATS_CACHE_KEY = 'dashboard:stats:v1'
+SAVINGS_CACHE_KEY = 'dashboard:savings:v1'
+FILE_TYPES_CACHE_KEY = 'dashboard:types:v1'
+
+DASHBOARD_CACHE_KEYS = [STATS_CACHE_KEY, SAVINGS_CACHE_KEY, FILE_TYPES_CACHE_KEY]
+
+def original_file_cache_key(file_hash):
+    """Cache key for the original file with the given (raw) hash"""
+    return f'files:original:{bytes(file_hash).hex()}'
+
+def invalidate_dashboard_cache():
+    """Drop cached dashboard responses so the next request recomputes them"""
+    cache.delete_many(DASHBOARD_CACHE_KEYS)
+
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+@receiver(post_save, sender=StorageSaving)
+@receiver(post_delete, sender=StorageSaving)
+def files_changed(sender, **kwargs):
+    """Invalidate dashboard caches whenever files or savings change"""
+    # Wait for the writer's transaction (which may still run the StorageSaving
+    # UPDATE) to commit, so a concurrent request can't re-cache stale data
+    transaction.on_commit(invalidate_dashboard_cache)
+
+@receiver(post_delete, sender=File)
+def original_file_deleted(sender, instance, **kwargs):
+    """Stop handing out a deleted original to new duplicate uploads"""
+    if not instance.is_duplicate and instance.file_hash is not None:
+        # After commit, so a concurrent upload can't re-cache it in between
+        cache_key = original_file_cache_key(instance.file_hash)
+        transaction.on_commit(lambda: cache.delete(cache_key))
+
+@receiver(post_save, sender=File)
+def file_created(sender, instance, created, **kwargs):
+    """Count new files in their upload month (runs in the saving transaction)"""
+    if created:
+        MonthlyFileCount.add_files(instance.uploaded_at)
+
+@receiver(post_delete, sender=File)
+def file_removed(sender, instance, **kwargs):
+    """Uncount deleted files from their upload month"""
+    MonthlyFileCount.add_files(instance.uploaded_at, -1)
@@ -0,0 +1,239 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import File, MonthlyFileCount, StorageSaving
+from .views import FileViewSet
+
+
+def upload(name, content, content_type='text/plain'):
+    return SimpleUploadedFile(name, content, content_type=content_type)
+
+
+class FileAPITestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.client = APIClient()
+
+    def stored_keys(self):
+        return sorted(os.listdir(os.path.join(self.media_root, 'uploads')))
+
+
+class UploadTests(FileAPITestCase):
+    def upload(self, name, content, content_type='text/plain'):
+        response = self.client.post('/api/files/', {'file': upload(name, content, content_type)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_lost_race_with_other_extension_drops_its_bytes(self):
+        original = self.upload('x.bin', b'content', 'application/octet-stream')
+
+        # The lookup misses, as if the original committed after it ran
+        with mock.patch.object(FileViewSet, '_find_original', return_value=None):
+            record = self.upload('y.pdf', b'content', 'application/pdf')
+
+        self.assertTrue(record['is_duplicate'])
+        self.assertEqual(record['reference_file_id'], original['id'])
+        self.assertEqual(File.objects.get(pk=record['id']).file.name, File.objects.get(pk=original['id']).file.name)
+        self.assertEqual(self.stored_keys(), [hashlib.sha256(b'content').hexdigest() + '.bin'])
+
+    def test_lost_race_to_deleted_original_stores_upload(self):
+        original = self.upload('x.txt', b'content')
+        real_save, real_only = File.save, File.objects.only
+        conflicted = []
+
+        def save_conflicting_once(file, *args, **kwargs):
+            # The insert conflicts with the original...
+            if file.original_filename == 'y.txt' and not conflicted:
+                conflicted.append(file)
+                raise IntegrityError('UNIQUE constraint failed: uniq_original_hash')
+            return real_save(file, *args, **kwargs)
+
+        def only_after_original_deleted(*fields):
+            # ...which is deleted before the winner is looked up
+            if conflicted:
+                File.objects.filter(pk=original['id']).delete()
+            return real_only(*fields)
+
+        with mock.patch.object(FileViewSet, '_find_original', return_value=None), \
+                mock.patch.object(File, 'save', autospec=True, side_effect=save_conflicting_once), \
+                mock.patch.object(File.objects, 'only', side_effect=only_after_original_deleted):
+            record = self.upload('y.txt', b'content')
+
+        self.assertFalse(record['is_duplicate'])
+        self.assertEqual(list(File.objects.values_list('original_filename', flat=True)), ['y.txt'])
+        self.assertEqual(self.stored_keys(), [hashlib.sha256(b'content').hexdigest() + '.txt'])
+
+class PrecheckTests(FileAPITestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/files/', {'file': upload('a.txt', b'hello')}, format='multipart')
+        self.original = response.json()
+        self.sha256 = hashlib.sha256(b'hello').hexdigest()
+
+    def test_precheck(self):
+        response = self.client.post('/api/files/precheck/', {'sha256': self.sha256}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': self.original['id']})
+
+        response = self.client.post('/api/files/precheck/', {'sha256': hashlib.sha256(b'other').hexdigest()}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/api/files/precheck/', {'sha256': 'not-a-hash'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_from_hash(self):
+        response = self.client.post('/api/files/', {'sha256': self.sha256.upper(), 'original_filename': 'b.txt'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        record = response.json()
+        self.assertTrue(record['is_duplicate'])
+        self.assertEqual(record['reference_file_id'], self.original['id'])
+        self.assertEqual(record['file_type'], 'application/octet-stream')
+        self.assertEqual(record['size'], len(b'hello'))
+        self.assertEqual(StorageSaving.get_total_savings(), {'total_bytes_saved': 5, 'total_duplicate_count': 1})
+
+    def test_create_from_unknown_hash(self):
+        body = {'sha256': hashlib.sha256(b'other').hexdigest(), 'original_filename': 'b.txt'}
+        response = self.client.post('/api/files/', body, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_create_from_hash_validates_body(self):
+        invalid_bodies = [
+            {'original_filename': 'b.txt'},
+            {'sha256': 'abc', 'original_filename': 'b.txt'},
+            {'sha256': self.sha256},
+            {'sha256': self.sha256, 'original_filename': ['b.txt']},
+            {'sha256': self.sha256, 'original_filename': 'b' * 300},
+            {'sha256': self.sha256, 'original_filename': 'b.txt', 'file_type': ['text/plain']},
+            {'sha256': self.sha256, 'original_filename': 'b.txt', 'file_type': 't' * 101},
+        ]
+        for body in invalid_bodies:
+            response = self.client.post('/api/files/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(File.objects.count(), 1)
+
+
+class BulkUploadTests(FileAPITestCase):
+    def bulk_upload(self, *files):
+        response = self.client.post('/api/files/bulk_upload/', {'files': list(files)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_repeated_content_in_one_batch(self):
+        records = self.bulk_upload(
+            upload('a.txt', b'same'),
+            upload('b.txt', b'same'),
+            upload('c.txt', b'other'),
+            upload('d.txt', b'same'),
+        )
+
+        self.assertEqual([r['is_duplicate'] for r in records], [False, True, False, True])
+        self.assertEqual(records[1]['reference_file_id'], records[0]['id'])
+        self.assertEqual(records[3]['reference_file_id'], records[0]['id'])
+        self.assertEqual(records[0]['file_hash'], hashlib.sha256(b'same').hexdigest())
+        self.assertEqual(File.objects.filter(file_hash=hashlib.sha256(b'same').digest(), is_duplicate=False).count(), 1)
+        # Duplicates share the original's stored object
+        self.assertEqual({f.file.name for f in File.objects.filter(original_filename__in=['a.txt', 'b.txt', 'd.txt'])}, {File.objects.get(pk=records[0]['id']).file.name})
+
+    def test_original_dropped_by_ignore_conflicts(self):
+        real_bulk_create = File.objects.bulk_create
+        winner = {}
+
+        def bulk_create_after_concurrent_upload(objs, *args, **kwargs):
+            # A concurrent upload of the same content commits first
+            if not winner:
+                winner['file'] = File.objects.create(
+                    file='uploads/winner.txt',
+                    original_filename='winner.txt',
+                    file_type='text/plain',
+                    size=4,
+                    file_hash=hashlib.sha256(b'race').digest(),
+                )
+            return real_bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(File.objects, 'bulk_create', side_effect=bulk_create_after_concurrent_upload):
+            records = self.bulk_upload(upload('a.md', b'race'), upload('b.md', b'race'))
+
+        winner_id = str(winner['file'].id)
+        self.assertTrue(all(r['is_duplicate'] for r in records))
+        self.assertEqual([r['reference_file_id'] for r in records], [winner_id, winner_id])
+        # Both point at the winner's stored object, and the losing copy is gone
+        self.assertEqual([File.objects.get(pk=r['id']).file.name for r in records], ['uploads/winner.txt', 'uploads/winner.txt'])
+        self.assertEqual(self.stored_keys(), [])
+        self.assertEqual(File.objects.filter(is_duplicate=False).count(), 1)
+        self.assertEqual(StorageSaving.get_total_savings(), {'total_bytes_saved': 8, 'total_duplicate_count': 2})
+
+    def test_stats_and_savings_after_bulk_upload(self):
+        self.client.post('/api/files/', {'file': upload('first.txt', b'hello')}, format='multipart')
+        self.client.get('/api/files/stats/')  # Cache the pre-upload stats
+
+        self.bulk_upload(
+            upload('a.txt', b'hello'),
+            upload('b.bin', b'payload', 'application/octet-stream'),
+            upload('c.bin', b'payload', 'application/octet-stream'),
+        )
+
+        stats = self.client.get('/api/files/stats/').json()
+        self.assertEqual(stats['total_files'], 4)
+        self.assertEqual(stats['duplicate_count'], 2)
+        self.assertEqual(stats['bytes_saved'], len(b'hello') + len(b'payload'))
+        self.assertEqual(stats['file_types'], {'application': 2, 'text': 2})
+        self.assertEqual(sum(entry['count'] for entry in stats['date_distribution']), 4)
+        self.assertEqual(sum(MonthlyFileCount.objects.values_list('count', flat=True)), 4)
+
+        savings = self.client.get('/api/files/storage_savings/').json()
+        self.assertEqual(savings['total_duplicate_count'], 2)
+        self.assertEqual(savings['total_bytes_saved'], 12)
+        self.assertEqual(savings['total_files'], 4)
+
+    def test_bulk_upload_requires_files(self):
+        response = self.client.post('/api/files/bulk_upload/', {}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class FileHashBinaryMigrationTests(TransactionTestCase):
+    before = [('files', '0007_monthlyfilecount')]
+    after = [('files', '0008_file_hash_binary')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # Leave the schema at the latest migration for the other tests
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_hex_to_binary_and_back(self):
+        hex_hash = hashlib.sha256(b'hello').hexdigest()
+        apps = self.migrate(self.before)
+        OldFile = apps.get_model('files', 'File')
+        original = OldFile.objects.create(file='uploads/a.txt', original_filename='a.txt', file_type='text/plain', size=5, file_hash=hex_hash)
+        OldFile.objects.create(file='uploads/a.txt', original_filename='b.txt', file_type='text/plain', size=5, file_hash=hex_hash, is_duplicate=True, reference_file=original)
+        OldFile.objects.create(file='uploads/c.txt', original_filename='c.txt', file_type='text/plain', size=1, file_hash=None)
+
+        apps = self.migrate(self.after)
+        NewFile = apps.get_model('files', 'File')
+        hashes = {f.original_filename: f.file_hash and bytes(f.file_hash) for f in NewFile.objects.all()}
+        self.assertEqual(hashes, {'a.txt': bytes.fromhex(hex_hash), 'b.txt': bytes.fromhex(hex_hash), 'c.txt': None})
+
+        apps = self.migrate(self.before)
+        OldFile = apps.get_model('files', 'File')
+        hashes = dict(OldFile.objects.values_list('original_filename', 'file_hash'))
+        self.assertEqual(hashes, {'a.txt': hex_hash, 'b.txt': hex_hash, 'c.txt': None})
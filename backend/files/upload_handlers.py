@@ -0,0 +1,36 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+class HashingUploadMixin:
+    """Compute the SHA-256 of an upload while its chunks are being received
+
+    The raw digest is attached to the resulting uploaded file as ``sha256`` so the
+    view doesn't have to read the whole file a second time to hash it.
+    """
+    
+    def is_hashing(self):
+        return True
+    
+    def new_file(self, *args, **kwargs):
+        # Set up before super() - the memory handler raises StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+    
+    def receive_data_chunk(self, raw_data, start):
+        if self.is_hashing():
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+    
+    def file_complete(self, file_size):
+        file_obj = super().file_complete(file_size)
+        if file_obj is not None:
+            file_obj.sha256 = self.sha256.digest()
+        return file_obj
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    def is_hashing(self):
+        # When not activated the chunks are passed on to the next handler
+        return self.activated
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
@@ -1,42 +1,201 @@
 # backend/files/views.py
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Sum
-from django.db.models.functions import TruncMonth
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Count, Sum, Window
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, status, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import File, StorageSaving, calculate_file_hash
-from .serializers import FileSerializer, StorageSavingSerializer, StorageSavingSummarySerializer
+from .models import File, StorageSaving, MonthlyFileCount, calculate_file_hash, get_main_type
+from .signals import STATS_CACHE_KEY, SAVINGS_CACHE_KEY, FILE_TYPES_CACHE_KEY, original_file_cache_key, invalidate_dashboard_cache
+from .serializers import FileSerializer, FileFromHashSerializer, StorageSavingSerializer, StorageSavingSummarySerializer
 from django.utils import timezone
+import logging
 import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# How long (in seconds) a hash -> original file lookup is reused by later uploads
+ORIGINAL_FILE_CACHE_TIMEOUT = 60
+
+SHA256_HEX_RE = re.compile(r'[0-9a-fA-F]{64}')
+
+# Fields search results can be sorted by (each one is indexed)
+ALLOWED_SORTS = {'uploaded_at', 'size', 'original_filename', 'file_type'}
+
+def parse_sha256(value):
+    """Raw digest for a hex SHA-256 from a request, or None if it isn't one"""
+    if not isinstance(value, str) or not SHA256_HEX_RE.fullmatch(value):
+        return None
+    return bytes.fromhex(value)
+
+def main_type_counts():
+    """Count files per main file type category (e.g., image/png -> image)"""
+    return (
+        File.objects
+        .values('main_type')
+        .annotate(count=Count('id'))
+        .order_by('main_type')
+    )
 
 class FileViewSet(viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
     
+    def list(self, request, *args, **kwargs):
+        # The listing is unpaginated, so stream rows from the cursor instead of
+        # holding every model instance in the queryset result cache
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(queryset.iterator(chunk_size=2000), many=True)
+        return Response(serializer.data)
+    
     def create(self, request, *args, **kwargs):
         file_obj = request.FILES.get('file')
         if not file_obj:
+            # Content the client knows is already stored (see precheck) can be
+            # registered by its hash alone, without sending the bytes again
+            if 'sha256' in request.data:
+                return self._create_from_hash(request)
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calculate file hash
-        file_content = file_obj.read()
-        file_hash = calculate_file_hash(file_content)
-        file_obj.seek(0)  # Reset file pointer
+        # Use the hash computed while the upload was received, if available
+        file_hash = getattr(file_obj, 'sha256', None) or calculate_file_hash(file_obj)
         
-        print(f"File hash calculated: {file_hash}")  # Debug print
+        # Only format the digest when debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("File hash calculated: %s", file_hash.hex())
         
         # Check if this file already exists (by hash)
-        existing_file = File.objects.filter(file_hash=file_hash, is_duplicate=False).first()
+        existing_file = self._find_original(file_hash)
         
         if existing_file:
-            print(f"Found existing file with hash: {file_hash}")  # Debug print
-            
-            # Create new file record that points to the existing file
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Found existing file with hash: %s", file_hash.hex())
+            response = self._create_duplicate(file_obj.name, file_obj.content_type, file_hash, existing_file)
+            if response is not None:
+                return response
+            # The original is gone - store this upload as the new original
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("No existing file found with hash: %s", file_hash.hex())
+        
+        # New unique file - directly create the model instance
+        new_file = File(
+            original_filename=file_obj.name,
+            file_type=file_obj.content_type,
+            size=file_obj.size,
+            file_hash=file_hash,  # Ensure hash is set
+            is_duplicate=False
+        )
+        
+        self._store_content(new_file, file_obj)
+        
+        try:
+            with transaction.atomic():
+                new_file.save()
+        except IntegrityError:
+            # A concurrent upload of the same content won the race - record this
+            # upload as a duplicate instead
+            response = None
+            existing_file = File.objects.only('id', 'file', 'size').filter(file_hash=file_hash, is_duplicate=False).first()
+            if existing_file is not None:
+                response = self._create_duplicate(file_obj.name, file_obj.content_type, file_hash, existing_file)
+            if response is not None:
+                # Drop our copy of the bytes if it was stored under a different
+                # key (the key includes the extension)
+                if new_file.file.name != existing_file.file.name:
+                    self._discard_content(new_file.file.name)
+                return response
+            # The winner is already gone - store this upload as the original
+            with transaction.atomic():
+                new_file.save()
+        cache.set(original_file_cache_key(file_hash), new_file, ORIGINAL_FILE_CACHE_TIMEOUT)
+        
+        # Serialize and return
+        serializer = self.get_serializer(new_file)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+    
+    def _store_content(self, new_file, file_obj):
+        """Write an original file's bytes to storage and point the record at them"""
+        # Content-addressable storage: the key is derived from the hash, so the
+        # same bytes are only written once even when uploads race each other
+        field = new_file.file.field
+        storage = field.storage
+        storage_key = field.generate_filename(new_file, file_obj.name)
+        if not storage.exists(storage_key):
+            saved_key = storage.save(storage_key, file_obj, max_length=field.max_length)
+            if saved_key != storage_key:
+                # Another process wrote the same content first - keep theirs
+                storage.delete(saved_key)
+        new_file.file = storage_key
+    
+    def _discard_content(self, storage_key):
+        """Delete bytes stored for an upload that lost a race, unless a record uses them"""
+        if not File.objects.filter(file=storage_key).exists():
+            File._meta.get_field('file').storage.delete(storage_key)
+    
+    def _create_from_hash(self, request):
+        """Register a duplicate of stored content identified by its SHA-256"""
+        body = FileFromHashSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        file_hash = body.validated_data['sha256']
+        original_filename = body.validated_data['original_filename']
+        
+        existing_file = self._find_original(file_hash)
+        if existing_file is None:
+            return Response({'error': 'No file stored with this hash'}, status=status.HTTP_404_NOT_FOUND)
+        
+        file_type = body.validated_data.get('file_type') or 'application/octet-stream'
+        response = self._create_duplicate(original_filename, file_type, file_hash, existing_file)
+        if response is None:
+            return Response({'error': 'No file stored with this hash'}, status=status.HTTP_404_NOT_FOUND)
+        return response
+    
+    def _find_original(self, file_hash):
+        """Find the original file with the given hash, or None"""
+        # Uploads of the same content in a burst share the first lookup's result
+        cache_key = original_file_cache_key(file_hash)
+        existing_file = cache.get(cache_key)
+        if existing_file is not None:
+            return existing_file
+        
+        existing_file = File.objects.only('id', 'file', 'size').filter(file_hash=file_hash, is_duplicate=False).first()
+        if existing_file is not None:
+            cache.set(cache_key, existing_file, ORIGINAL_FILE_CACHE_TIMEOUT)
+        return existing_file
+    
+    def _create_duplicate(self, original_filename, file_type, file_hash, existing_file):
+        """Create a file record that points to an existing original file
+
+        Returns None if the original no longer exists.
+        """
+        try:
+            duplicate_file = self._save_duplicate(original_filename, file_type, file_hash, existing_file)
+        except IntegrityError:
+            # The original was deleted after it was looked up (e.g. a stale cache
+            # entry in another worker) - drop the entry and ask the database
+            cache.delete(original_file_cache_key(file_hash))
+            existing_file = File.objects.only('id', 'file', 'size').filter(file_hash=file_hash, is_duplicate=False).first()
+            if existing_file is None:
+                return None
+            duplicate_file = self._save_duplicate(original_filename, file_type, file_hash, existing_file)
+        
+        # Serialize and return
+        serializer = self.get_serializer(duplicate_file)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+    
+    def _save_duplicate(self, original_filename, file_type, file_hash, existing_file):
+        """Save a duplicate record and its storage saving in one transaction"""
+        with transaction.atomic():
             duplicate_file = File(
-                original_filename=file_obj.name,
-                file_type=file_obj.content_type,
-                size=file_obj.size,
+                original_filename=original_filename,
+                file_type=file_type,
+                size=existing_file.size,  # Same content, same size
                 file_hash=file_hash,  # Ensure hash is set
                 is_duplicate=True,
                 reference_file=existing_file,
@@ -45,30 +204,128 @@ class FileViewSet(viewsets.ModelViewSet):
             duplicate_file.save()
             
             # Record storage savings
-            StorageSaving.add_saving(file_obj.size)
+            StorageSaving.add_saving(existing_file.size)
+        return duplicate_file
+    
+    @action(detail=False, methods=['post'])
+    def bulk_upload(self, request):
+        """
+        Upload several files in one request (multipart 'files' field)
+        
+        Duplicates are resolved with one hash lookup for the whole batch, new
+        originals and duplicates are each written with a single multi-row
+        INSERT, and the storage savings with a single UPDATE.
+        """
+        file_objs = request.FILES.getlist('files')
+        if not file_objs:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Hashes computed while the uploads were received, if available
+        hashes = [getattr(file_obj, 'sha256', None) or calculate_file_hash(file_obj) for file_obj in file_objs]
+        
+        # Originals this batch may duplicate, in one query
+        originals = {
+            bytes(original.file_hash): original
+            for original in File.objects.only('id', 'file', 'size', 'file_hash').filter(file_hash__in=set(hashes), is_duplicate=False)
+        }
+        
+        # bulk_create skips save(), so main_type is set here
+        records, new_files, duplicates = [], [], []
+        for file_obj, file_hash in zip(file_objs, hashes):
+            original = originals.get(file_hash)
+            if original is None:
+                # First copy of this content - later copies in the batch point to it
+                original = File(
+                    original_filename=file_obj.name,
+                    file_type=file_obj.content_type,
+                    main_type=get_main_type(file_obj.content_type),
+                    size=file_obj.size,
+                    file_hash=file_hash,
+                    is_duplicate=False
+                )
+                self._store_content(original, file_obj)
+                originals[file_hash] = original
+                new_files.append(original)
+                records.append(original)
+            else:
+                duplicate_file = File(
+                    original_filename=file_obj.name,
+                    file_type=file_obj.content_type,
+                    main_type=get_main_type(file_obj.content_type),
+                    size=original.size,
+                    file_hash=file_hash,
+                    is_duplicate=True,
+                    reference_file=original,
+                    file=original.file
+                )
+                duplicates.append(duplicate_file)
+                records.append(duplicate_file)
+        
+        lost_keys = []
+        with transaction.atomic():
+            File.objects.bulk_create(new_files, batch_size=500, ignore_conflicts=True)
             
-            # Serialize and return
-            serializer = self.get_serializer(duplicate_file)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-        else:
-            print(f"No existing file found with hash: {file_hash}")  # Debug print
+            # Originals skipped by ON CONFLICT lost a race with a concurrent
+            # upload of the same content - turn them into duplicates of the winner
+            inserted = set(File.objects.filter(pk__in=[f.pk for f in new_files]).values_list('pk', flat=True))
+            lost = [f for f in new_files if f.pk not in inserted]
+            if lost:
+                winners = {
+                    bytes(winner.file_hash): winner
+                    for winner in File.objects.only('id', 'file', 'size', 'file_hash').filter(file_hash__in=[f.file_hash for f in lost], is_duplicate=False)
+                }
+                for duplicate_file in duplicates:
+                    if duplicate_file.reference_file in lost:
+                        duplicate_file.reference_file = winners[duplicate_file.file_hash]
+                        duplicate_file.file = duplicate_file.reference_file.file
+                for lost_file in lost:
+                    winner = winners[lost_file.file_hash]
+                    if lost_file.file.name != winner.file.name:
+                        # Stored under another key (the key includes the extension)
+                        lost_keys.append(lost_file.file.name)
+                    lost_file.is_duplicate = True
+                    lost_file.reference_file = winner
+                    lost_file.file = winner.file
+                    duplicates.append(lost_file)
+                    originals[lost_file.file_hash] = winner
             
-            # New unique file - directly create the model instance
-            new_file = File(
-                file=file_obj,
-                original_filename=file_obj.name,
-                file_type=file_obj.content_type,
-                size=file_obj.size,
-                file_hash=file_hash,  # Ensure hash is set
-                is_duplicate=False
-            )
-            new_file.save()
+            File.objects.bulk_create(duplicates, batch_size=500)
             
-            # Serialize and return
-            serializer = self.get_serializer(new_file)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+            # Signals don't fire for bulk_create, so do their bookkeeping here
+            if duplicates:
+                StorageSaving.add_saving(sum(f.size for f in duplicates), len(duplicates))
+            MonthlyFileCount.add_files(records[0].uploaded_at, len(records))
+        
+        # Drop the bytes the lost originals stored
+        for storage_key in lost_keys:
+            self._discard_content(storage_key)
+        
+        invalidate_dashboard_cache()
+        for file_hash, original in originals.items():
+            cache.set(original_file_cache_key(file_hash), original, ORIGINAL_FILE_CACHE_TIMEOUT)
+        
+        serializer = self.get_serializer(records, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def precheck(self, request):
+        """
+        Check whether content with the given SHA-256 is already stored
+        
+        Clients can hash a file locally and call this before uploading it. On
+        a hit (200) they register the upload with POST /files/ and a body of
+        sha256, original_filename and file_type instead of sending the bytes;
+        on a miss (404) they upload the file as usual.
+        """
+        file_hash = parse_sha256(request.data.get('sha256'))
+        if not file_hash:
+            return Response({'error': 'A valid sha256 is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        existing_file = self._find_original(file_hash)
+        if existing_file is None:
+            return Response({'error': 'No file stored with this hash'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({'id': existing_file.id})
     
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -82,7 +339,7 @@ class FileViewSet(viewsets.ModelViewSet):
         - max_size: Maximum file size in bytes
         - start_date: Start date for upload date range (YYYY-MM-DD)
         - end_date: End date for upload date range (YYYY-MM-DD)
-        - sort_by: Field to sort by (default: uploaded_at)
+        - sort_by: Field to sort by, one of ALLOWED_SORTS (default: uploaded_at)
         - sort_order: asc or desc (default: desc)
         - page: Page number for pagination
         - page_size: Number of items per page
@@ -121,11 +378,14 @@ class FileViewSet(viewsets.ModelViewSet):
         # Apply sorting
         sort_by = request.query_params.get('sort_by', 'uploaded_at')
         sort_order = request.query_params.get('sort_order', 'desc')
+        if sort_by not in ALLOWED_SORTS:
+            sort_by = 'uploaded_at'
         
+        # id breaks ties so rows with equal sort values keep their place across pages
         if sort_order == 'asc':
-            queryset = queryset.order_by(sort_by)
+            queryset = queryset.order_by(sort_by, 'id')
         else:
-            queryset = queryset.order_by(f'-{sort_by}')
+            queryset = queryset.order_by(f'-{sort_by}', '-id')
         
         # Get pagination parameters
         page_size = int(request.query_params.get('page_size', 10))
@@ -135,13 +395,18 @@ class FileViewSet(viewsets.ModelViewSet):
         start_index = (page - 1) * page_size
         end_index = start_index + page_size
         
-        # Count total results for pagination info
-        total_count = queryset.count()
+        # Get paginated results, counting the full result set in the same
+        # query with COUNT(*) OVER () instead of a separate count()
+        results = list(queryset.annotate(total_count=Window(expression=Count('*')))[start_index:end_index])
+        if results:
+            total_count = results[0].total_count
+        elif page > 1:
+            # Page past the end - the window count has no row to ride on
+            total_count = queryset.count()
+        else:
+            total_count = 0
         total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
         
-        # Get paginated results
-        results = queryset[start_index:end_index]
-        
         # Serialize results
         serializer = self.get_serializer(results, many=True)
         
@@ -161,28 +426,34 @@ class FileViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def file_types(self, request):
         """Get unique file types for filtering options"""
+        file_types = cache.get_or_set(FILE_TYPES_CACHE_KEY, self._build_file_types, settings.DASHBOARD_CACHE_TIMEOUT)
+        return Response(file_types)
+    
+    def _build_file_types(self):
+        """Compute the file_types response data (cached by the file_types action)"""
         # Get all file types and count files of each type
-        file_types = {}
-        
-        # Group files by main file type category (e.g., image/png -> image)
-        for file in File.objects.all():
-            main_type = file.file_type.split('/')[0] if '/' in file.file_type else file.file_type
-            
-            if main_type not in file_types:
-                file_types[main_type] = {
-                    'type': main_type,
-                    'count': 0
-                }
-            
-            file_types[main_type]['count'] += 1
+        file_types = [
+            {'type': entry['main_type'], 'count': entry['count']}
+            for entry in main_type_counts()
+        ]
         
-        return Response(list(file_types.values()))
+        return file_types
     
     @action(detail=False, methods=['get'])
     def storage_savings(self, request):
         """Get storage savings statistics from deduplication"""
-        # Get total number of files
-        total_files = File.objects.count()
+        savings_data = cache.get_or_set(SAVINGS_CACHE_KEY, self._build_storage_savings, settings.DASHBOARD_CACHE_TIMEOUT)
+        return Response(savings_data)
+    
+    def _build_storage_savings(self):
+        """Compute the storage_savings response data (cached by the storage_savings action)"""
+        # Get total number of files and their size in one query
+        totals = File.objects.aggregate(
+            total_files=Count('id'),
+            total_size=Coalesce(Sum('size'), 0),
+        )
+        total_files = totals['total_files']
+        total_size = totals['total_size']
         
         # Get deduplication statistics
         savings = StorageSaving.get_total_savings()
@@ -190,8 +461,6 @@ class FileViewSet(viewsets.ModelViewSet):
         total_duplicate_count = savings['total_duplicate_count']
         
         # Calculate efficiency (percentage of storage saved) - safely
-        total_size = File.objects.aggregate(total=Sum('size'))['total'] or 0
-        
         if total_size > 0 or total_bytes_saved > 0:
             efficiency_percentage = (total_bytes_saved / (total_size + total_bytes_saved)) * 100
         else:
@@ -206,30 +475,16 @@ class FileViewSet(viewsets.ModelViewSet):
         }
         
         serializer = StorageSavingSummarySerializer(summary_data)
-        return Response(serializer.data)
+        return serializer.data
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get file statistics for dashboard"""
-        # Total files
-        total_files = File.objects.count()
-        
-        # Total size
-        total_size = File.objects.aggregate(total=Sum('size'))['total'] or 0
-        
-        # Duplicates
-        duplicate_count = File.objects.filter(is_duplicate=True).count()
-        
-        # File types distribution
-        file_types = {}
-        for file in File.objects.all():
-            main_type = file.file_type.split('/')[0] if '/' in file.file_type else file.file_type
-            
-            if main_type not in file_types:
-                file_types[main_type] = 0
-            
-            file_types[main_type] += 1
-        
+        stats_data = cache.get_or_set(STATS_CACHE_KEY, self._build_stats, settings.DASHBOARD_CACHE_TIMEOUT)
+        return Response(stats_data)
+    
+    def _build_stats(self):
+        """Compute the stats response data (cached by the stats action)"""
         # Size distribution (count files in different size ranges)
         size_ranges = {
             'small': {'min': 0, 'max': 1 * 1024 * 1024, 'count': 0},  # 0-1MB
@@ -237,33 +492,30 @@ class FileViewSet(viewsets.ModelViewSet):
             'large': {'min': 10 * 1024 * 1024, 'max': 1000 * 1024 * 1024, 'count': 0}  # >10MB (but with a reasonable upper bound)
         }
         
-        for file in File.objects.all():
-            for range_name, range_data in size_ranges.items():
-                if range_data['min'] <= file.size < range_data['max']:
-                    size_ranges[range_name]['count'] += 1
-                    break
+        # Total files, total size, duplicates and the size ranges in one query
+        totals = File.objects.aggregate(
+            total_files=Count('id'),
+            total_size=Coalesce(Sum('size'), 0),
+            duplicate_count=Count('id', filter=Q(is_duplicate=True)),
+            **{
+                f'size_{range_name}': Count('id', filter=Q(size__gte=range_data['min'], size__lt=range_data['max']))
+                for range_name, range_data in size_ranges.items()
+            }
+        )
+        total_files = totals['total_files']
+        total_size = totals['total_size']
+        duplicate_count = totals['duplicate_count']
+        for range_name, range_data in size_ranges.items():
+            range_data['count'] = totals[f'size_{range_name}']
+        
+        # File types distribution
+        file_types = {entry['main_type']: entry['count'] for entry in main_type_counts()}
         
-        # Date distribution (by month) - safer implementation using Django's built-in functionality
-        try:
-            date_distribution = []
-            if File.objects.exists():
-                date_entries = (
-                    File.objects
-                    .annotate(month=TruncMonth('uploaded_at'))
-                    .values('month')
-                    .annotate(count=Count('id'))
-                    .order_by('month')
-                )
-                
-                for entry in date_entries:
-                    if entry['month']:
-                        date_distribution.append({
-                            'month': entry['month'].strftime('%Y-%m'),
-                            'count': entry['count']
-                        })
-        except Exception as e:
-            # Fallback if there's any issue with the date processing
-            date_distribution = []
+        # Date distribution (by month), from the counts maintained on write
+        date_distribution = [
+            {'month': entry.month.strftime('%Y-%m'), 'count': entry.count}
+            for entry in MonthlyFileCount.objects.filter(count__gt=0).order_by('month')
+        ]
         
         # Storage savings
         savings = StorageSaving.get_total_savings()
@@ -288,4 +540,4 @@ class FileViewSet(viewsets.ModelViewSet):
             'date_distribution': date_distribution
         }
         
-        return Response(stats_data)
\ No newline at end of file
+        return stats_data
\ No newline at end of file
@@ -30,8 +30,51 @@ export interface StorageSavingsStats {
   formatted_bytes_saved: string;
 }
 
+// Files above this size are uploaded without a precheck, since SubtleCrypto
+// has to hold the whole file in memory to hash it
+const PRECHECK_MAX_SIZE = 512 * 1024 * 1024;
+
+async function computeSha256(file: File): Promise<string | null> {
+  // SubtleCrypto is only available in secure contexts (HTTPS or localhost)
+  if (!window.crypto?.subtle || file.size > PRECHECK_MAX_SIZE) {
+    return null;
+  }
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, '0'))
+    .join('');
+}
+
 export const fileService = {
+  async precheckFile(sha256: string): Promise<boolean> {
+    try {
+      await axios.post(`${API_URL}/files/precheck/`, { sha256 });
+      return true;
+    } catch (error) {
+      if (axios.isAxiosError(error) && error.response?.status === 404) {
+        return false;
+      }
+      throw error;
+    }
+  },
+
   async uploadFile(file: File): Promise<FileType> {
+    // Skip sending the bytes when the server already stores this content. The
+    // precheck is only an optimisation, so any failure falls back to a normal upload
+    try {
+      const sha256 = await computeSha256(file);
+      if (sha256 && await fileService.precheckFile(sha256)) {
+        const response = await axios.post(`${API_URL}/files/`, {
+          sha256,
+          original_filename: file.name,
+          file_type: file.type,
+        });
+        return response.data;
+      }
+    } catch (error) {
+      console.warn('Upload precheck failed, uploading file:', error);
+    }
+
     const formData = new FormData();
     formData.append('file', file);
 